@@ -1,26 +1,33 @@
 import attr
+import itertools
 import sqlite3
 import datetime
 
-@attr.s
+@attr.s(slots=True, frozen=True)
 class Grant:
     issuer = attr.ib()
     title = attr.ib()
     cash_prize = attr.ib()
     entry_fee = attr.ib()
     deadline = attr.ib()
-    genres = attr.ib()
     description = attr.ib()
     read_more_link = attr.ib()
+    extra_info = attr.ib(default=None, kw_only=True)
+    # Not a grants column; only used to populate grant_genre, so it stays last
+    genres = attr.ib()
 
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import aiohttp
+from concurrent.futures import ProcessPoolExecutor
+import lxml.html
+from lxml.etree import XPath
 
 class GenreManager:
     def __init__(self, conn):
         self.conn = conn
         self.create_genre_table()
         self.create_grant_genre_table()
+        self.load_genre_cache()
 
     def create_genre_table(self):
         with self.conn:
@@ -42,18 +49,37 @@ class GenreManager:
                     UNIQUE(grant_id, genre_id)
                 )
             ''')
+            # Index both sides of the link table so joins can start from either a grant or a genre
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_gg_grant ON grant_genre(grant_id)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_gg_genre ON grant_genre(genre_id)')
+
+    def load_genre_cache(self):
+        # Keep name -> id in memory so linking never has to query genres by name
+        cursor = self.conn.execute('SELECT id, name FROM genres')
+        self._cache = {name: genre_id for genre_id, name in cursor.fetchall()}
+
+    def _insert_genre(self, genre):
+        if genre in self._cache:
+            return
+        cursor = self.conn.execute('''
+            INSERT OR IGNORE INTO genres (name) VALUES (?)
+        ''', (genre,))
+        if cursor.rowcount == 1:
+            self._cache[genre] = cursor.lastrowid
 
     def add_genre(self, genre):
         with self.conn:
-            self.conn.execute('''
-                INSERT OR IGNORE INTO genres (name) VALUES (?)
-            ''', (genre,))
+            self._insert_genre(genre)
 
     def get_genre_id(self, genre):
+        if genre in self._cache:
+            return self._cache[genre]
         cursor = self.conn.execute('''
             SELECT id FROM genres WHERE name = ?
         ''', (genre,))
         result = cursor.fetchone()
+        if result:
+            self._cache[genre] = result[0]
         return result[0] if result else None
 
     def link_grant_to_genre(self, grant_id, genre):
@@ -65,6 +91,21 @@ class GenreManager:
                     VALUES (?, ?)
                 ''', (grant_id, genre_id))
 
+    def link_grants_to_genres(self, links):
+        # Bulk variant of add_genre + link_grant_to_genre; the caller owns the transaction.
+        # Distinct new genres go in with one executemany and the cache is reloaded
+        # once, leaving a single executemany for the links themselves.
+        new_genres = [genre for genre in dict.fromkeys(genre for _, genre in links) if genre not in self._cache]
+        if new_genres:
+            self.conn.executemany('''
+                INSERT OR IGNORE INTO genres (name) VALUES (?)
+            ''', ((genre,) for genre in new_genres))
+            self.load_genre_cache()
+        self.conn.executemany('''
+            INSERT OR IGNORE INTO grant_genre (grant_id, genre_id)
+            VALUES (?, ?)
+        ''', ((grant_id, self._cache[genre]) for grant_id, genre in links))
+
     def get_genres_for_grant(self, grant_id):
         cursor = self.conn.execute('''
             SELECT g.name FROM genres g
@@ -74,11 +115,33 @@ class GenreManager:
         return [row[0] for row in cursor.fetchall()]
 
 class Database:
+    # Column order matches the field order of Grant so rows come straight from attr.astuple.
+    # Genres are only stored through grant_genre, so the trailing Grant.genres is sliced off.
+    INSERT_SQL = '''
+        INSERT INTO grants (issuer, title, cash_prize, entry_fee, deadline, description, read_more_link, extra_info)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING id
+    '''
+
     def __init__(self, db_name):
         self.conn = sqlite3.connect(db_name)
+        self.configure_connection()
         self.genre_manager = GenreManager(self.conn)  # Composition
         self.create_table()
 
+    def configure_connection(self):
+        # page_size only takes effect on a fresh database and must precede the
+        # switch to WAL, so it goes first
+        self.conn.execute('PRAGMA page_size=8192')
+        # WAL with synchronous=NORMAL avoids the two fsyncs per commit of the
+        # default rollback journal; temp tables and sort buffers stay in memory
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA temp_store=MEMORY')
+        # Read pages through a 256 MiB memory map backed by a 128 MiB page cache
+        self.conn.execute('PRAGMA mmap_size=268435456')
+        self.conn.execute('PRAGMA cache_size=-131072')
+
     def create_table(self):
         with self.conn:
             self.conn.execute('''
@@ -89,7 +152,6 @@ class Database:
                     cash_prize TEXT,
                     entry_fee TEXT,
                     deadline TEXT,
-                    genres TEXT,
                     description TEXT,
                     read_more_link TEXT,
                     extra_info TEXT,
@@ -98,128 +160,179 @@ class Database:
             ''')
 
     def insert_grant(self, grant):
+        self.insert_grants([grant])
+
+    def insert_grants(self, grants, chunk_size=500):
+        # Consume grants lazily and commit once per chunk, so a streaming
+        # scrape never has to be held in memory all at once
+        grants = iter(grants)
+        while True:
+            chunk = list(itertools.islice(grants, chunk_size))
+            if not chunk:
+                break
+            self._insert_chunk(chunk)
+
+    def _insert_chunk(self, grants):
+        # Insert the whole chunk inside a single transaction instead of committing per row
+        genre_links = []
+        try:
+            with self.conn:
+                for grant in grants:
+                    try:
+                        grant_id = self.conn.execute(self.INSERT_SQL, attr.astuple(grant, recurse=False)[:-1]).fetchone()[0]
+                    except sqlite3.IntegrityError:
+                        print(f"Grant already exists: {grant.title} by {grant.issuer} with deadline {grant.deadline}")
+                        continue
+
+                    for genre in grant.genres.split(','):
+                        genre = genre.strip()
+                        if genre:  # Ensure the genre is not an empty string
+                            genre_links.append((grant_id, genre))
+
+                self.genre_manager.link_grants_to_genres(genre_links)
+        except Exception:
+            # A rolled back batch can leave genres in the cache that were never saved
+            self.genre_manager.load_genre_cache()
+            raise
+
+    def analyze(self):
+        # Refresh planner statistics after a bulk load so the grant_genre indexes get used
         with self.conn:
-            try:
-                # Dynamically build the insert statement based on available attributes
-                columns = ['issuer', 'title', 'cash_prize', 'entry_fee', 'deadline', 'genres', 'description', 'read_more_link']
-                values = [getattr(grant, col) for col in columns]
-                
-                # Add extra_info if it exists
-                if hasattr(grant, 'extra_info'):
-                    columns.append('extra_info')
-                    values.append(grant.extra_info)
-                
-                # Build the SQL insert statement
-                columns_str = ', '.join(columns)
-                placeholders_str = ', '.join(['?' for _ in columns])
-                
-                sql = f'''
-                    INSERT INTO grants ({columns_str})
-                    VALUES ({placeholders_str})
-                '''
-                
-                self.conn.execute(sql, values)
-                
-                grant_id = self.conn.execute('SELECT last_insert_rowid()').fetchone()[0]
-                for genre in grant.genres.split(','):
-                    genre = genre.strip()
-                    if genre:  # Ensure the genre is not an empty string
-                        self.genre_manager.add_genre(genre)
-                        self.genre_manager.link_grant_to_genre(grant_id, genre)
-            except sqlite3.IntegrityError:
-                print(f"Grant already exists: {grant.title} by {grant.issuer} with deadline {grant.deadline}")
+            self.conn.execute('ANALYZE')
 
     def fetch_all_grants(self):
         with self.conn:
-            cursor = self.conn.execute('SELECT * FROM grants')
-            grants = cursor.fetchall()
+            # Collect each grant's genres in the same query instead of one query per grant
+            cursor = self.conn.execute('''
+                SELECT g.*, GROUP_CONCAT(ge.name, '|') FROM grants g
+                LEFT JOIN grant_genre gg ON gg.grant_id = g.id
+                LEFT JOIN genres ge ON ge.id = gg.genre_id
+                GROUP BY g.id
+            ''')
             grants_with_genres = []
-            for grant in grants:
-                grant_id = grant[0]
-                genres = self.genre_manager.get_genres_for_grant(grant_id)
-                grants_with_genres.append((grant, genres))
+            for row in cursor.fetchall():
+                genres = row[-1].split('|') if row[-1] else []
+                grants_with_genres.append((row[:-1], genres))
             return grants_with_genres
 
     def close(self):
         self.conn.close()
 
 
-def scrape_grants():
+def _has_class(name):
+    # Match a whole class name inside a space-separated class attribute
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+# Compiled once at import; each grant field is a single XPath evaluated in C.
+# normalize-space() returns the field already stripped, and smart_strings=False
+# stops the results from keeping a reference back into the parsed page.
+GRANT_ROWS = XPath(f'//div[{_has_class("views-row")}]')
+FIELDS = tuple((name, XPath(expression, smart_strings=False)) for name, expression in (
+    ('issuer', f'normalize-space(.//div[{_has_class("views-field-field-award-issuer")}]//h2)'),
+    ('title', f'normalize-space(.//div[{_has_class("views-field-title")}]//h2)'),
+    ('cash_prize', f'normalize-space(.//div[{_has_class("views-field-field-cash-prize")}]//span[{_has_class("field-content")}])'),
+    ('entry_fee', f'normalize-space(.//div[{_has_class("views-field-field-entry-amount-int")}]//span[{_has_class("field-content")}])'),
+    ('deadline', f'normalize-space(.//div[{_has_class("views-field-field-deadline")}]//span[{_has_class("field-content")}])'),
+    ('genres', f'normalize-space(.//div[{_has_class("views-field-taxonomy-vocabulary-3")}]//span[{_has_class("field-content")}])'),
+    ('description', f'normalize-space(.//div[{_has_class("views-field-body")}]//div[{_has_class("field-content")}]//p)'),
+    ('read_more_link', f'concat("https://www.pw.org", .//div[{_has_class("views-field-body")}]//div[{_has_class("field-content")}]//a[{_has_class("views-more-link")}]/@href)'),
+))
+
+def parse_page(content):
+    # Runs in a worker process, so it returns plain dicts that pickle cheaply
+    # and leaves building Grant objects to the main process
+    tree = lxml.html.fromstring(content)
+
+    # Evaluate every field XPath against each grant entry
+    return [{name: xpath(grant) for name, xpath in FIELDS} for grant in GRANT_ROWS(tree)]
+
+async def fetch_page(session, url):
+    async with session.get(url) as response:
+        # Check if the request was successful
+        if response.status != 200:
+            print(f'Failed to retrieve the page: {response.status}')
+            return None
+        return await response.read()
+
+async def fetch_and_parse(session, pool, url):
+    content = await fetch_page(session, url)
+    if content is None:
+        return None
+    # A page with no grant rows can be recognised from its bytes alone, which
+    # skips both the worker round trip and a full parse past the last page
+    if b'views-row' not in content:
+        return []
+    # Parse off the event loop so pages keep downloading while others are parsed
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, parse_page, content)
+
+async def scrape_grants_async(batch_size=10):
     base_url = 'https://www.pw.org/grants?page='
     page = 0
     headers = {
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36'
     }
 
-    grants_list = []
+    # Keep one pooled connection per in-flight page alive across batches so
+    # every batch after the first reuses them instead of re-handshaking
+    connector = aiohttp.TCPConnector(limit_per_host=batch_size, keepalive_timeout=30)
 
-    while True:
-        # Construct the URL for the current page
-        url = f"{base_url}{page}"
-        response = requests.get(url, headers=headers)
+    # HTML parsing is CPU bound, so spread it over one worker process per core
+    with ProcessPoolExecutor() as pool:
+        async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+            while True:
+                # Fetch and parse the next batch of pages concurrently
+                pages = range(page, page + batch_size)
+                results = await asyncio.gather(*(fetch_and_parse(session, pool, f"{base_url}{i}") for i in pages))
 
-        # Check if the request was successful
-        if response.status_code != 200:
-            print(f'Failed to retrieve the page: {response.status_code}')
-            break
-
-        # Parse the HTML content using BeautifulSoup
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Find all the grant entries
-        grants = soup.find_all('div', class_='views-row')
-        
-        # Check if no grants were found
-        if len(grants) == 0:
-            print(f'No more grants found on page {page}. Stopping.')
-            break
-
-        print(f"Number of grants found on page {page}: {len(grants)}")
-
-        # Extract information and create Grant objects
-        for grant in grants:
-            issuer = grant.find('div', class_='views-field-field-award-issuer').find('h2').text.strip()
-            title = grant.find('div', class_='views-field-title').find('h2').text.strip()
-            cash_prize = grant.find('div', class_='views-field-field-cash-prize').find('span', class_='field-content').text.strip()
-            entry_fee = grant.find('div', class_='views-field-field-entry-amount-int').find('span', class_='field-content').text.strip()
-            deadline = grant.find('div', class_='views-field-field-deadline').find('span', class_='field-content').text.strip()
-            genres = grant.find('div', class_='views-field-taxonomy-vocabulary-3').find('span', class_='field-content').text.strip()
-            description_div = grant.find('div', class_='views-field-body').find('div', class_='field-content')
-            description = description_div.find('p').text.strip()
-            read_more_link = description_div.find('a', class_='views-more-link')['href']
-
-            grant_obj = Grant(
-                issuer=issuer,
-                title=title,
-                cash_prize=cash_prize,
-                entry_fee=entry_fee,
-                deadline=deadline,
-                genres=genres,
-                description=description,
-                read_more_link=f"https://www.pw.org{read_more_link}"
-            )
-            grants_list.append(grant_obj)
-        
-        # Increment the page number for the next iteration
-        page += 1
-
-    return grants_list
-
-# Initialize the database
-db = Database('grants.db')
-
-# Run the scraper and get the list of grants
-grants_list = scrape_grants()
-
-# Insert grants into the database
-for grant in grants_list:
-    db.insert_grant(grant)
-
-# Fetch and print all grants from the database
-all_grants = db.fetch_all_grants()
-for grant, genres in all_grants:
-    print(grant)
-    print("Genres:", genres)
-
-# Close the database connection
-db.close()
\ No newline at end of file
+                # Walk the batch in page order so we stop at the first empty page
+                for i, rows in zip(pages, results):
+                    if rows is None:
+                        return
+
+                    grants = [Grant(**row) for row in rows]
+
+                    # Check if no grants were found
+                    if len(grants) == 0:
+                        print(f'No more grants found on page {i}. Stopping.')
+                        return
+
+                    print(f"Number of grants found on page {i}: {len(grants)}")
+                    yield grants
+
+                # Move on to the next batch of pages
+                page += batch_size
+
+def scrape_grants():
+    # Drive the async scraper one page at a time and yield its grants, so
+    # they can be inserted as they arrive instead of after the whole scrape
+    loop = asyncio.new_event_loop()
+    pages = scrape_grants_async()
+    try:
+        while True:
+            try:
+                grants = loop.run_until_complete(pages.__anext__())
+            except StopAsyncIteration:
+                break
+            yield from grants
+    finally:
+        loop.run_until_complete(pages.aclose())
+        loop.close()
+
+# Worker processes re-import this module, so only run the scrape when executed directly
+if __name__ == '__main__':
+    # Initialize the database
+    db = Database('grants.db')
+
+    # Scrape grants and insert them into the database as they are parsed
+    db.insert_grants(scrape_grants())
+    db.analyze()
+
+    # Fetch and print all grants from the database
+    all_grants = db.fetch_all_grants()
+    for grant, genres in all_grants:
+        print(grant)
+        print("Genres:", genres)
+
+    # Close the database connection
+    db.close()
\ No newline at end of file